@@ -28,10 +28,12 @@ import re
 import sys
 import unicodedata
 from collections import Counter, defaultdict
+from functools import lru_cache
 from typing import Dict, Set, Tuple, List, Iterable, Optional
 
 import requests
-from bs4 import BeautifulSoup, Tag
+import soupsieve as sv
+from bs4 import BeautifulSoup, SoupStrainer, Tag
 
 # ---------------- Config / Regex ----------------
 
@@ -39,41 +41,69 @@ HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; vote-tally/1.5)"}
 
 # Find EVERY "Title (digits)" pair anywhere in the body.
 # Non-greedy title; digits parens; next must be boundary-ish (end/whitespace/newline)
-VOTE_PAIR_REGEX = re.compile(r"(?P<title>.+?)\s*\((?P<points>\d+)\)(?=(?:\s+|$))")
+VOTE_PAIR_REGEX = re.compile(r"(?P<title>.+?)\s*\((?P<points>\d+)\)(?=\s|$)")
+
+# Only comment-bearing elements are built into the tree; site chrome, sidebars,
+# and script/style are skipped at parse time.
+COMMENT_STRAINER = SoupStrainer(["article", "li", "div"], class_=re.compile(r"comment"))
+
+# Author anchors; compiled once instead of on every soup.select() call.
+_AUTHOR_SEL = sv.compile('a[rel="author"], .link-user')
+
+# Whitespace collapsing; _WS_NEEDS_COLLAPSE finds runs or non-space whitespace so
+# the common single-spaced title can skip the substitution entirely.
+_WS_RE = re.compile(r"\s+")
+_WS_NEEDS_COLLAPSE = re.compile(r"\s{2,}|[^\S ]")
+
+# Per-comment wrapper on Tildes; excludes the comment's nested replies.
+_COMMENT_CONTAINER_CLASS = "comment-itself"
+# Class of the per-comment controls ("Link", "Parent", ...).
+_NAV_LINK_CLASS = "comment-nav-link"
+_PARENT_TEXT_RE = re.compile(r"^\s*parent\s*$", re.IGNORECASE)
+
+# Class names that mark a comment's body/text block.
+_BODY_CLASSES = frozenset({"topic-comment-text", "comment-text", "markdown", "md", "content", "text"})
+_FALLBACK_BODY_CLASSES = _BODY_CLASSES - {"topic-comment-text", "comment-text"}
 
 # ---------------- Normalization ----------------
 
 def normalize_unicode(s: str) -> str:
+    # Pure-ASCII text is already NFC.
+    if s.isascii():
+        return s.strip()
     return unicodedata.normalize("NFC", s).strip()
 
+_PUNCT_TABLE = str.maketrans({
+    "\u2019": "'", "\u2018": "'", "\u2032": "'",
+    "\u201C": '"', "\u201D": '"',
+    "\u2013": "-", "\u2014": "-", "\u2212": "-",
+    "\u00A0": " ",
+})
+
 def fold_punct(s: str) -> str:
-    repl = {
-        "\u2019": "'", "\u2018": "'", "\u2032": "'",
-        "\u201C": '"', "\u201D": '"',
-        "\u2013": "-", "\u2014": "-", "\u2212": "-",
-        "\u00A0": " ",
-    }
-    for k, v in repl.items():
-        s = s.replace(k, v)
-    s = re.sub(r"\s+", " ", s)
+    s = s.translate(_PUNCT_TABLE)
+    if _WS_NEEDS_COLLAPSE.search(s):
+        s = _WS_RE.sub(" ", s)
     return s.strip()
 
+@lru_cache(maxsize=8192)
 def norm_key(s: str) -> str:
     return fold_punct(normalize_unicode(s)).lower()
 
 # ---------------- Games TSV w/ aliases ----------------
 
 def _add_key_with_variants(mapper: Dict[str, str], key: str, canonical: str, warnset: set, debug: bool):
-    for k in {key, key.rstrip("!?.")}:
+    # Only keys ending in !?. have a distinct trailing-punctuation variant.
+    variants = (key,) if not key or key[-1] not in "!?." else (key, key.rstrip("!?."))
+    for k in variants:
         if not k:
             continue
         prev = mapper.get(k)
-        if prev and prev != canonical:
-            if debug and (k, prev, canonical) not in warnset:
-                print(f"[warn] key collision: '{k}' -> '{prev}' vs '{canonical}' (keeping first)")
-                warnset.add((k, prev, canonical))
-        else:
-            mapper.setdefault(k, canonical)
+        if prev is None:
+            mapper[k] = canonical
+        elif prev != canonical and debug and (k, prev, canonical) not in warnset:
+            print(f"[warn] key collision: '{k}' -> '{prev}' vs '{canonical}' (keeping first)")
+            warnset.add((k, prev, canonical))
 
 def parse_games_file(path: str, debug: bool = False):
     """
@@ -88,6 +118,7 @@ def parse_games_file(path: str, debug: bool = False):
     """
     allowed: Set[str] = set()
     key_to_canonical: Dict[str, str] = {}
+    canon_keys: Set[str] = set()
     rollovers: Dict[str, int] = defaultdict(int)
     warnset = set()
 
@@ -126,6 +157,7 @@ def parse_games_file(path: str, debug: bool = False):
             # Record canonical
             allowed.add(canonical)
             ck = norm_key(canonical)
+            canon_keys.add(ck)
             _add_key_with_variants(key_to_canonical, ck, canonical, warnset, debug)
 
             # Aliases
@@ -157,7 +189,6 @@ def parse_games_file(path: str, debug: bool = False):
                 rollovers[canonical] += pts  # accumulate if duplicates appear
 
     if debug:
-        canon_keys = {norm_key(t) for t in allowed}
         alias_count = sum(1 for k in key_to_canonical if k not in canon_keys)
         total_roll = sum(rollovers.values())
         print(f"[games] Canonical: {len(allowed)}  total match-keys: {len(key_to_canonical)} (~{alias_count} aliases)")
@@ -168,15 +199,28 @@ def parse_games_file(path: str, debug: bool = False):
 
 # ---------------- Fetch + DOM helpers ----------------
 
-def fetch_soup(url: str, debug=False) -> BeautifulSoup:
+def fetch_soup(url: str, debug=False) -> Tuple[BeautifulSoup, bytes]:
+    """Return (soup, raw_response_bytes); the soup holds only the strained comment subtrees."""
     r = requests.get(url, headers=HEADERS, timeout=30)
+    raw = r.content
     if debug:
-        print(f"[fetch] {url} -> {r.status_code}, {len(r.text)} bytes")
+        print(f"[fetch] {url} -> {r.status_code}, {len(raw)} bytes")
     r.raise_for_status()
-    return BeautifulSoup(r.text, "html.parser")
+    # Hand lxml the raw bytes (no intermediate str). Trust the charset only when
+    # the server declared one; otherwise let bs4 sniff <meta charset>.
+    declared = "charset" in r.headers.get("Content-Type", "").lower()
+    soup = BeautifulSoup(raw, "lxml", parse_only=COMMENT_STRAINER,
+                         from_encoding=r.encoding if declared else None)
+    return soup, raw
 
 def has_parent_link(tag: Tag) -> bool:
     """Replies on Tildes show a 'Parent' control; top-level ballots do not."""
+    # Only the comment's nav links can be the control; skips markdown-body anchors.
+    # find() stops at the first match, so replies return as soon as 'Parent' is seen.
+    if tag.find("a", class_=_NAV_LINK_CLASS, string=_PARENT_TEXT_RE) is not None:
+        return True
+    if tag.find("a", class_=_NAV_LINK_CLASS) is not None:
+        return False
     a = tag.find("a", string=lambda s: s and s.strip().lower() == "parent")
     return a is not None
 
@@ -185,36 +229,49 @@ def looks_like_comment_container(tag: Tag) -> bool:
     if not isinstance(tag, Tag):
         return False
     # Must contain an author link and a body/text block somewhere inside.
-    has_author = bool(tag.select_one('a[rel="author"], .link-user'))
-    has_body = bool(tag.select_one(".topic-comment-text, .comment-text, .markdown, .md, .content, .text"))
+    has_author = bool(tag.find("a", attrs={"rel": "author"}) or tag.find(class_="link-user"))
+    has_body = bool(tag.find(class_=lambda c: c in _BODY_CLASSES))
     return has_author and has_body
 
 def extract_author(tag: Tag) -> str:
-    a = tag.select_one('a[rel="author"]') or tag.select_one(".link-user")
+    a = tag.find("a", attrs={"rel": "author"}) or tag.find(class_="link-user")
     if a and a.get_text(strip=True):
         return a.get_text(strip=True)
     return "UNKNOWN_USER"
 
 def extract_body_text(tag: Tag) -> str:
-    el = (tag.select_one(".topic-comment-text")
-          or tag.select_one(".comment-text")
-          or tag.select_one(".markdown, .md, .content, .text"))
+    el = (tag.find(class_="topic-comment-text")
+          or tag.find(class_="comment-text")
+          or tag.find(class_=lambda c: c in _FALLBACK_BODY_CLASSES))
     if el:
         return el.get_text("\n", strip=True)
     return tag.get_text("\n", strip=True)
 
 def find_top_level_containers(soup: BeautifulSoup, debug=False) -> List[Tag]:
     """
-    Robust search that does NOT depend on exact class names:
+    Fast path: Tildes wraps each comment's own header/body/controls (but not its
+    replies) in div.comment-itself, so take those in one pass and keep the ones
+    with no 'Parent' link.
+
+    Fallback, used only when no such wrapper exists. It only sees what COMMENT_STRAINER
+    kept (article/li/div elements with a "comment" class and their subtrees), but
+    within those it does not depend on exact class names:
       1) Start from each author anchor and climb to a reasonable container.
       2) Keep containers that:
           - look like comments, and
           - do NOT contain a 'Parent' link (=> treat as top-level)
     """
+    candidates = soup.find_all("div", class_=_COMMENT_CONTAINER_CLASS)
+    if candidates:
+        containers = [c for c in candidates if not has_parent_link(c)]
+        if debug:
+            print(f"[scan] top-level containers found (via .{_COMMENT_CONTAINER_CLASS}): {len(containers)}")
+        return containers
+
     containers: List[Tag] = []
     seen = set()
-    for a in soup.select('a[rel="author"], .link-user'):
-        # Climb to nearest block-ish container
+    for a in _AUTHOR_SEL.select(soup):
+        # Climb to nearest block-ish container that looks like a comment
         t = a
         parent = None
         for _ in range(6):  # climb a few levels only
@@ -228,9 +285,6 @@ def find_top_level_containers(soup: BeautifulSoup, debug=False) -> List[Tag]:
         if id(parent) in seen:
             continue
         seen.add(id(parent))
-        # Must still look like a comment container
-        if not looks_like_comment_container(parent):
-            continue
         # Top-level if there is NO 'Parent' link inside this container
         if not has_parent_link(parent):
             containers.append(parent)
@@ -244,24 +298,22 @@ def find_top_level_containers(soup: BeautifulSoup, debug=False) -> List[Tag]:
 def find_vote_pairs(text: str) -> List[Tuple[str, int]]:
     pairs = []
     for m in VOTE_PAIR_REGEX.finditer(text):
-        title = normalize_unicode(m.group("title"))
-        pts = int(m.group("points"))
-        pairs.append((title, pts))
+        # Raw title (norm_key normalizes when matching); kept as typed for the ignored log.
+        pairs.append((m.group("title").strip(), int(m.group("points"))))
     return pairs
 
 def parse_ballot_pairs(pairs: Iterable[Tuple[str, int]], key_to_canonical: Dict[str, str], debug=False, author=""):
-    per_game = Counter()
+    per_game: Dict[str, int] = {}
     ignored = []
     for title_raw, pts in pairs:
-        key = norm_key(title_raw)
-        canonical = key_to_canonical.get(key)
+        canonical = key_to_canonical.get(norm_key(title_raw))
         if canonical:
-            per_game[canonical] += pts
+            per_game[canonical] = per_game.get(canonical, 0) + pts
         else:
             ignored.append((title_raw, pts))
             if debug:
                 print(f"  [ignored] {author}: '{title_raw}' ({pts}) not in allowed/alias list")
-    return dict(per_game), ignored
+    return per_game, ignored
 
 def validate_ballot(per_game: dict) -> Tuple[bool, List[str]]:
     reasons = []
@@ -324,18 +376,22 @@ def main():
         sys.exit(1)
 
     # Fetch page
-    soup = fetch_soup(args.url, debug=args.debug)
+    soup, raw_html = fetch_soup(args.url, debug=args.debug)
     if args.dump_html:
         try:
-            with open(args.dump_html, "w", encoding="utf-8") as fh:
-                fh.write(str(soup))
+            # Write the response body as received (the strained soup is incomplete).
+            with open(args.dump_html, "wb") as fh:
+                fh.write(raw_html)
             if args.debug:
                 print(f"[dump] Saved HTML to {args.dump_html}")
         except Exception as e:
             print(f"[dump] Failed to save HTML: {e}")
 
     # Tally
-    game_totals = Counter(rollovers)   # <-- seed with pre-existing points
+    # Seed every allowed game (pre-existing points or 0) so ballots never grow the dict.
+    # sorted(): `allowed` is a set, and its iteration order varies with hash seeding.
+    game_totals = Counter({title: rollovers.get(title, 0) for title in sorted(allowed)})
+    tallied_games = set(rollovers)  # games with rollover points or a counted vote
     invalid_log = []
     ignored_by_user = defaultdict(list)
 
@@ -349,13 +405,14 @@ def main():
         ballots_seen += 1
         user = com["author"]
         authors_seen.add(user)
+        dbg_user = args.debug and (author_debug_re is None or author_debug_re.search(user))
 
         per_game, ignored = parse_ballot_pairs(com["pairs"], key_to_canonical, debug=args.debug, author=user)
         if ignored:
             ignored_by_user[user].extend(ignored)
         ignored_votes_total += len(ignored)
 
-        if args.debug and (author_debug_re is None or author_debug_re.search(user)):
+        if dbg_user:
             if per_game:
                 print(f"  [parsed] {user}: " + ", ".join(f"{k} ({v})" for k, v in per_game.items()))
             else:
@@ -368,28 +425,30 @@ def main():
         if not ok:
             invalid_ballots += 1
             invalid_log.append(f"{user}: " + "; ".join(reasons))
-            if args.debug and (author_debug_re is None or author_debug_re.search(user)):
+            if dbg_user:
                 print(f"  [INVALID] {invalid_log[-1]}")
             continue
 
         valid_ballots += 1
         for title, pts in per_game.items():
             game_totals[title] += pts
-        if args.debug and (author_debug_re is None or author_debug_re.search(user)):
+        tallied_games.update(per_game)
+        if dbg_user:
             print(f"  [OK] Counted {user}'s ballot")
 
 
     # Write outputs
-    all_rows = [(title, game_totals.get(title, 0)) for title in allowed]
+    all_rows = list(game_totals.items())
 
     # Sort: primary = points desc, secondary = title asc (case-insensitive)
+    # list.sort computes key= once per row (decorate-sort-undecorate), so .lower()
+    # already runs N times, not per comparison.
     all_rows.sort(key=lambda x: (-x[1], x[0].lower()))
 
     with open(args.tally_out, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f)
         w.writerow(["game", "total_points"])
-        for title, pts in all_rows:
-            w.writerow([title, pts])
+        w.writerows(all_rows)
 
     invalid_log_sorted = sorted(set(invalid_log))
     with open(args.invalid_out, "w", encoding="utf-8") as f:
@@ -411,8 +470,12 @@ def main():
                     f.write(f"  - {title_raw} ({pts})\n")
 
     # Console summary
-    total_rollover_pts = sum(rollovers.values())
-    nonzero_rollover_games = sum(1 for v in rollovers.values() if v > 0)
+    total_rollover_pts = 0
+    nonzero_rollover_games = 0
+    for v in rollovers.values():
+        total_rollover_pts += v
+        if v > 0:
+            nonzero_rollover_games += 1
 
     print("\n=== Scrape Summary ===")
     print(f"Authors seen:            {len(authors_seen)}")
@@ -421,16 +484,18 @@ def main():
     print(f"Invalid ballots:         {invalid_ballots}")
     print(f"Ignored vote pairs:      {ignored_votes_total}")
     print(f"Rollover points applied: {total_rollover_pts} across {nonzero_rollover_games} games")
-    print(f"Games tallied:           {len(game_totals)}")
+    print(f"Games tallied:           {len(tallied_games)}")
     print(f"Games tallied:           {len(allowed)}  (including zero-point games)")
     print(f"Wrote tally to:          {args.tally_out}")
     print(f"Wrote invalids to:       {args.invalid_out}")
     print(f"Wrote ignored votes to:  {args.ignored_out}")
 
     if args.print_summary:
-        if game_totals:
+        # Same (-points, title.lower()) order as tally.csv
+        top = [(title, pts) for title, pts in all_rows if title in tallied_games][:20]
+        if top:
             print("\nTop results:")
-            for title, pts in game_totals.most_common(20):
+            for title, pts in top:
                 print(f"  {title}: {pts}")
         else:
             print("\nNo tallies produced. Use --debug, --author-debug and --dump-html for visibility.")